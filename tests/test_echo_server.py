@@ -7,46 +7,71 @@ This server responds to basic MCP methods over STDIO.
 import json
 import sys
 
-def handle_initialize():
-    return {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "result": {
-            "protocolVersion": "2024-11-05",
-            "capabilities": {
-                "tools": {"listChanged": True},
-                "logging": {}
-            },
-            "serverInfo": {
-                "name": "echo-mcp-server",
-                "version": "1.0.0"
-            }
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+# Every reply is a single bytes line; static ones are serialized at import time
+INITIALIZE_RESPONSE = json_dumps({
+    "jsonrpc": "2.0",
+    "id": 1,
+    "result": {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {
+            "tools": {"listChanged": True},
+            "logging": {}
+        },
+        "serverInfo": {
+            "name": "echo-mcp-server",
+            "version": "1.0.0"
         }
     }
+}) + b"\n"
 
-def handle_tools_list():
-    return {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "result": {
-            "tools": [
-                {
-                    "name": "echo",
-                    "description": "Echo back the input text",
-                    "inputSchema": {
-                        "type": "object",
-                        "properties": {
-                            "text": {
-                                "type": "string",
-                                "description": "Text to echo back"
-                            }
-                        },
-                        "required": ["text"]
-                    }
+TOOLS_LIST_RESPONSE = json_dumps({
+    "jsonrpc": "2.0",
+    "id": 1,
+    "result": {
+        "tools": [
+            {
+                "name": "echo",
+                "description": "Echo back the input text",
+                "inputSchema": {
+                    "type": "object",
+                    "properties": {
+                        "text": {
+                            "type": "string",
+                            "description": "Text to echo back"
+                        }
+                    },
+                    "required": ["text"]
                 }
-            ]
-        }
+            }
+        ]
     }
+}) + b"\n"
+
+ECHO_TEMPLATE = b'{"jsonrpc":"2.0","id":1,"result":{"content":[{"type":"text","text":"Echo: %b"}]}}\n'
+
+UNKNOWN_TOOL_TEMPLATE = b'{"jsonrpc":"2.0","id":1,"error":{"code":-32601,"message":"Unknown tool: %b"}}\n'
+METHOD_NOT_FOUND_TEMPLATE = b'{"jsonrpc":"2.0","id":%b,"error":{"code":-32601,"message":"Method not found: %b"}}\n'
+PARSE_ERROR_TEMPLATE = b'{"jsonrpc":"2.0","id":1,"error":{"code":-32700,"message":"Parse error: %b"}}\n'
+INVALID_REQUEST_RESPONSE = b'{"jsonrpc":"2.0","id":1,"error":{"code":-32600,"message":"Invalid Request"}}\n'
+INTERNAL_ERROR_TEMPLATE = b'{"jsonrpc":"2.0","id":%b,"error":{"code":-32603,"message":"Internal error: %b"}}\n'
+
+def escape_text(text):
+    """Return str(text) JSON-escaped, without the surrounding quotes"""
+    return memoryview(json_dumps(str(text)))[1:-1]
+
+def handle_initialize(params):
+    return INITIALIZE_RESPONSE
+
+def handle_tools_list(params):
+    return TOOLS_LIST_RESPONSE
 
 def handle_tools_call(params):
     tool_name = params.get("name")
@@ -54,70 +79,81 @@ def handle_tools_call(params):
     
     if tool_name == "echo":
         text = tool_args.get("text", "")
-        return {
-            "jsonrpc": "2.0",
-            "id": 1,
-            "result": {
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"Echo: {text}"
-                    }
-                ]
-            }
-        }
+        return ECHO_TEMPLATE % escape_text(text)
     
-    return {
-        "jsonrpc": "2.0",
-        "id": 1,
-        "error": {
-            "code": -32601,
-            "message": f"Unknown tool: {tool_name}"
-        }
-    }
+    return UNKNOWN_TOOL_TEMPLATE % escape_text(tool_name)
 
-def main():
-    for line in sys.stdin:
-        line = line.strip()
-        if not line:
-            continue
-            
-        try:
-            request = json.loads(line)
-            method = request.get("method")
-            params = request.get("params", {})
-            
-            if method == "initialize":
-                response = handle_initialize()
-            elif method == "tools/list":
-                response = handle_tools_list()
-            elif method == "tools/call":
-                response = handle_tools_call(params)
-            elif method == "notifications/initialized":
-                # No response needed for notifications
+def handle_notification(params):
+    # No response needed for notifications
+    return None
+
+def method_not_found(request_id, method):
+    return METHOD_NOT_FOUND_TEMPLATE % (json_dumps(request_id), escape_text(method))
+
+HANDLERS = {
+    "initialize": handle_initialize,
+    "tools/list": handle_tools_list,
+    "tools/call": handle_tools_call,
+    "notifications/initialized": handle_notification,
+}
+
+def serve(stdin, stdout, handlers=HANDLERS, loads=json_loads):
+    """Answer newline-delimited requests from the binary stdin on the binary stdout.
+
+    The handler table, decoder and stream methods used on every request are
+    locals or arguments, so the common path does no global lookups and PyPy's
+    JIT can specialize it. The rarer error replies still use module globals.
+    """
+    read = stdin.read1
+    write = stdout.write
+    flush = stdout.flush
+    pending = bytearray()
+
+    while True:
+        chunk = read(65536)
+        if not chunk:
+            if not pending:
+                break
+            # Terminate a final line that arrived without a newline
+            chunk = b"\n"
+        pending += chunk
+
+        while True:
+            newline = pending.find(b"\n")
+            if newline < 0:
+                break
+            line = pending[:newline]
+            del pending[:newline + 1]
+            # Both JSON decoders skip surrounding whitespace, so lines go in as-is
+            if not line or line.isspace():
+                continue
+
+            try:
+                request = loads(line)
+            except ValueError as e:
+                write(PARSE_ERROR_TEMPLATE % escape_text(e))
                 continue
+
+            if not isinstance(request, dict):
+                write(INVALID_REQUEST_RESPONSE)
+                continue
+            try:
+                handler = handlers[request["method"]]
+            except (KeyError, TypeError):
+                response = method_not_found(request.get("id", 1), request.get("method"))
             else:
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": request.get("id", 1),
-                    "error": {
-                        "code": -32601,
-                        "message": f"Method not found: {method}"
-                    }
-                }
-            
-            print(json.dumps(response), flush=True)
-            
-        except json.JSONDecodeError as e:
-            error_response = {
-                "jsonrpc": "2.0",
-                "id": 1,
-                "error": {
-                    "code": -32700,
-                    "message": f"Parse error: {str(e)}"
-                }
-            }
-            print(json.dumps(error_response), flush=True)
+                try:
+                    response = handler(request.get("params") or {})
+                except Exception as e:
+                    response = INTERNAL_ERROR_TEMPLATE % (json_dumps(request.get("id", 1)), escape_text(e))
+            if response is not None:
+                write(response)
+
+        # Every complete line in the chunk is answered before reading again
+        flush()
+
+def main():
+    serve(sys.stdin.buffer, sys.stdout.buffer)
 
 if __name__ == "__main__":
     main()
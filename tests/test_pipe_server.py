@@ -4,153 +4,441 @@ Simple MCP server that listens on a Unix domain socket (named pipe).
 This server demonstrates named pipe-based MCP communication.
 """
 
+import asyncio
+import collections
+import concurrent.futures
+import itertools
 import json
 import os
+import selectors
+import signal
 import socket
 import sys
-import threading
+import traceback
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+# Static responses are serialized once; only the request id is spliced in
+RESPONSE_PREFIX = b'{"jsonrpc":"2.0","id":'
+
+def result_suffix(result):
+    """Pre-encode a constant result as everything after the response id"""
+    return b',"result":' + json_dumps(result) + b'}\n'
+
+INITIALIZE_SUFFIX = result_suffix({
+    "protocolVersion": "2024-11-05",
+    "capabilities": {
+        "tools": {"listChanged": True},
+        "logging": {}
+    },
+    "serverInfo": {
+        "name": "named-pipe-mcp-server",
+        "version": "1.0.0"
+    }
+})
+
+TOOLS_LIST_SUFFIX = result_suffix({
+    "tools": [
+        {
+            "name": "pipe_echo",
+            "description": "Echo text through named pipe",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "message": {
+                        "type": "string",
+                        "description": "Message to echo back"
+                    }
+                },
+                "required": ["message"]
+            }
+        }
+    ]
+})
+
+# The echo reply is filled in with a single bytes % (id, text) format
+ECHO_TEMPLATE = (b'{"jsonrpc":"2.0","id":%b,"result":{"content":[{"type":"text",'
+                 b'"text":"Named Pipe Echo: %b"}]}}\n')
+
+# Error replies are templates too, so malformed input stays cheap to answer
+UNKNOWN_TOOL_TEMPLATE = (b'{"jsonrpc":"2.0","id":%b,"error":{"code":-32601,'
+                         b'"message":"Unknown tool: %b"}}\n')
+METHOD_NOT_FOUND_TEMPLATE = (b'{"jsonrpc":"2.0","id":%b,"error":{"code":-32601,'
+                             b'"message":"Method not found: %b"}}\n')
+PARSE_ERROR_TEMPLATE = (b'{"jsonrpc":"2.0","id":1,"error":{"code":-32700,'
+                        b'"message":"Parse error: %b"}}\n')
+INVALID_REQUEST_RESPONSE = (b'{"jsonrpc":"2.0","id":1,"error":{"code":-32600,'
+                            b'"message":"Invalid Request"}}\n')
+SERVER_BUSY_RESPONSE = (b'{"jsonrpc":"2.0","id":1,"error":{"code":-32000,'
+                        b'"message":"Server busy: too many clients"}}\n')
+INTERNAL_ERROR_TEMPLATE = (b'{"jsonrpc":"2.0","id":%b,"error":{"code":-32603,'
+                           b'"message":"Internal error: %b"}}\n')
+
+# Stay well below IOV_MAX (1024 on Linux and macOS) for each sendmsg call
+MAX_SEND_CHUNKS = 512
+
+# Stop reading from a client while this many reply bytes wait to be sent,
+# and bound the reads per wakeup so one busy client cannot starve the rest
+OUTBUF_HIGH_WATER = 1024 * 1024
+MAX_READS_PER_WAKEUP = 16
+
+# Fixed thread pool size, and so client limit, for the threaded fallback;
+# it stays below the thread count where context switching dominates
+MAX_THREADED_CLIENTS = 32
+
+def escape_text(text):
+    """JSON-escape text for splicing inside an existing string literal"""
+    # Slice the quotes off through a memoryview so the body is not copied
+    return memoryview(json_dumps(str(text)))[1:-1]
+
+def handle_initialize(request_id, params):
+    return (RESPONSE_PREFIX, json_dumps(request_id), INITIALIZE_SUFFIX)
+
+def handle_tools_list(request_id, params):
+    return (RESPONSE_PREFIX, json_dumps(request_id), TOOLS_LIST_SUFFIX)
+
+def handle_tools_call(request_id, params):
+    tool_name = params.get("name")
+    tool_args = params.get("arguments", {})
+
+    if tool_name == "pipe_echo":
+        message = tool_args.get("message", "")
+        return (ECHO_TEMPLATE % (json_dumps(request_id), escape_text(message)),)
+    return (UNKNOWN_TOOL_TEMPLATE % (json_dumps(request_id), escape_text(tool_name)),)
+
+def handle_notification(request_id, params):
+    # No response needed for notifications
+    return None
+
+def method_not_found(request_id, method):
+    return (METHOD_NOT_FOUND_TEMPLATE % (json_dumps(request_id), escape_text(method)),)
+
+HANDLERS = {
+    "initialize": handle_initialize,
+    "tools/list": handle_tools_list,
+    "tools/call": handle_tools_call,
+    "notifications/initialized": handle_notification,
+}
+
+def handle_request(request):
+    """Build the response chunks for a JSON-RPC request, or None for notifications"""
+    get = request.get
+    # Known methods are the common case, so look them up directly; a missing
+    # or unhashable (array/object) method is simply not found
+    try:
+        handler = HANDLERS[request["method"]]
+    except (KeyError, TypeError):
+        return method_not_found(get("id", 1), get("method"))
+    return handler(get("id", 1), get("params") or {})
+
+def handle_message(data):
+    """Parse one JSON-RPC message and return the response chunks, if any"""
+    try:
+        request = json_loads(data)
+    # ValueError also covers UnicodeDecodeError from the stdlib decoder on raw bytes
+    except ValueError as e:
+        return (PARSE_ERROR_TEMPLATE % escape_text(e),)
+
+    if not isinstance(request, dict):
+        return (INVALID_REQUEST_RESPONSE,)
+    # A bad request gets an error reply instead of dropping the connection,
+    # so replies already queued for the client's other requests still go out
+    try:
+        return handle_request(request)
+    except Exception as e:
+        return (INTERNAL_ERROR_TEMPLATE % (json_dumps(request.get("id", 1)), escape_text(e)),)
 
 def handle_client(conn):
-    """Handle a client connection"""
+    """Handle a client connection on its own thread"""
+    reader = conn.makefile('rb', buffering=65536)
+    writer = conn.makefile('wb', buffering=65536)
+    try:
+        # Requests are newline-delimited JSON-RPC messages
+        for line in reader:
+            if line.isspace():
+                continue
+
+            response_data = handle_message(line)
+            if response_data is not None:
+                writer.writelines(response_data)
+                writer.flush()
+
+    except Exception as e:
+        print(f"Error handling client: {e}", file=sys.stderr)
+    finally:
+        reader.close()
+        writer.close()
+        conn.close()
+
+class ClientState:
+    """Buffered input and output for a non-blocking client connection"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.inbuf = bytearray()
+        self.outbuf = collections.deque()
+        self.outbuf_size = 0
+        self.eof = False
+
+def close_client(sel, conn):
+    sel.unregister(conn)
+    conn.close()
+
+def accept_clients(sel, server_socket):
+    """Accept every pending connection and register each with the selector"""
+    # Drain the whole backlog per wakeup so bursts cost one select() call
+    while True:
+        try:
+            conn, addr = server_socket.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        sel.register(conn, selectors.EVENT_READ, data=ClientState(conn))
+
+def queue_lines(state):
+    """Handle every complete line in the input buffer and queue the replies"""
+    inbuf = state.inbuf
+    while True:
+        newline = inbuf.find(b"\n")
+        if newline < 0:
+            return
+        line = inbuf[:newline]
+        del inbuf[:newline + 1]
+        if not line or line.isspace():
+            continue
+        response_data = handle_message(line)
+        if response_data is not None:
+            state.outbuf.extend(response_data)
+            state.outbuf_size += sum(map(len, response_data))
+
+def flush_client(state):
+    """Send queued response chunks with gathered writes until the socket is full"""
+    outbuf = state.outbuf
+    while outbuf:
+        try:
+            sent = state.conn.sendmsg(itertools.islice(outbuf, MAX_SEND_CHUNKS))
+        except BlockingIOError:
+            return
+        state.outbuf_size -= sent
+        while sent:
+            chunk = outbuf[0]
+            if len(chunk) > sent:
+                # Partial write: keep the unsent tail and wait for EVENT_WRITE
+                outbuf[0] = chunk[sent:]
+                return
+            sent -= len(chunk)
+            outbuf.popleft()
+
+def service_client(sel, key, mask, recv_view):
+    """Read available requests and flush pending responses for one client"""
+    state = key.data
+    conn = state.conn
+    try:
+        if mask & selectors.EVENT_READ:
+            # Answer each read before the next one, and stop once the client
+            # is not keeping up with its replies
+            for _ in range(MAX_READS_PER_WAKEUP):
+                try:
+                    received = conn.recv_into(recv_view)
+                except BlockingIOError:
+                    break
+                if not received:
+                    state.eof = True
+                    # Leftover bytes at EOF are one last request
+                    if state.inbuf:
+                        state.inbuf += b"\n"
+                        queue_lines(state)
+                    break
+                state.inbuf += recv_view[:received]
+                queue_lines(state)
+                flush_client(state)
+                if state.outbuf_size > OUTBUF_HIGH_WATER:
+                    break
+
+        flush_client(state)
+
+        if state.eof and not state.outbuf:
+            close_client(sel, conn)
+            return
+
+        reading = not state.eof and state.outbuf_size <= OUTBUF_HIGH_WATER
+        events = selectors.EVENT_READ if reading else 0
+        if state.outbuf:
+            events |= selectors.EVENT_WRITE
+        if key.events != events:
+            sel.modify(conn, events, data=state)
+    except Exception as e:
+        print(f"Error handling client: {e}", file=sys.stderr)
+        close_client(sel, conn)
+
+def serve_selector(server_socket):
+    """Serve all clients from a single thread using the platform selector"""
+    sel = selectors.DefaultSelector()
+    # One receive buffer is reused for every read, since only one runs at a time
+    recv_view = memoryview(bytearray(65536))
+    server_socket.setblocking(False)
+    sel.register(server_socket, selectors.EVENT_READ, data=None)
     try:
         while True:
-            # Receive data from client
-            data = conn.recv(1024)
-            if not data:
-                break
-                
-            # Parse the JSON-RPC request
-            try:
-                request = json.loads(data.decode('utf-8').strip())
-                method = request.get("method")
-                params = request.get("params", {})
-                request_id = request.get("id", 1)
-                
-                if method == "initialize":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {
-                            "protocolVersion": "2024-11-05",
-                            "capabilities": {
-                                "tools": {"listChanged": True},
-                                "logging": {}
-                            },
-                            "serverInfo": {
-                                "name": "named-pipe-mcp-server",
-                                "version": "1.0.0"
-                            }
-                        }
-                    }
-                elif method == "tools/list":
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "result": {
-                            "tools": [
-                                {
-                                    "name": "pipe_echo",
-                                    "description": "Echo text through named pipe",
-                                    "inputSchema": {
-                                        "type": "object",
-                                        "properties": {
-                                            "message": {
-                                                "type": "string",
-                                                "description": "Message to echo back"
-                                            }
-                                        },
-                                        "required": ["message"]
-                                    }
-                                }
-                            ]
-                        }
-                    }
-                elif method == "tools/call":
-                    tool_name = params.get("name")
-                    tool_args = params.get("arguments", {})
-                    
-                    if tool_name == "pipe_echo":
-                        message = tool_args.get("message", "")
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "result": {
-                                "content": [
-                                    {
-                                        "type": "text",
-                                        "text": f"Named Pipe Echo: {message}"
-                                    }
-                                ]
-                            }
-                        }
-                    else:
-                        response = {
-                            "jsonrpc": "2.0",
-                            "id": request_id,
-                            "error": {
-                                "code": -32601,
-                                "message": f"Unknown tool: {tool_name}"
-                            }
-                        }
-                elif method == "notifications/initialized":
-                    # No response needed for notifications
-                    continue
+            for key, mask in sel.select(timeout=None):
+                if key.data is None:
+                    accept_clients(sel, server_socket)
                 else:
-                    response = {
-                        "jsonrpc": "2.0",
-                        "id": request_id,
-                        "error": {
-                            "code": -32601,
-                            "message": f"Method not found: {method}"
-                        }
-                    }
-                
-                # Send response
-                response_data = json.dumps(response) + "\n"
-                conn.send(response_data.encode('utf-8'))
-                
-            except json.JSONDecodeError as e:
-                error_response = {
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "error": {
-                        "code": -32700,
-                        "message": f"Parse error: {str(e)}"
-                    }
-                }
-                response_data = json.dumps(error_response) + "\n"
-                conn.send(response_data.encode('utf-8'))
-                
+                    service_client(sel, key, mask, recv_view)
+    finally:
+        sel.close()
+
+async def read_line(reader):
+    """Read one line of any length, unlike readline() which stops at the stream limit"""
+    parts = []
+    while True:
+        try:
+            parts.append(await reader.readuntil(b"\n"))
+        except asyncio.IncompleteReadError as e:
+            # EOF: whatever is left is a final line without a newline
+            parts.append(e.partial)
+        except asyncio.LimitOverrunError as e:
+            # The buffered data stays put, so take it and keep looking
+            parts.append(await reader.readexactly(e.consumed))
+            continue
+        return b"".join(parts)
+
+async def handle_stream(reader, writer):
+    """Handle a client connection on the asyncio event loop"""
+    try:
+        while True:
+            line = await read_line(reader)
+            if not line:
+                break
+            if line.isspace():
+                continue
+
+            response_data = handle_message(line)
+            if response_data is not None:
+                writer.writelines(response_data)
+                await writer.drain()
+
     except Exception as e:
         print(f"Error handling client: {e}", file=sys.stderr)
     finally:
-        conn.close()
+        writer.close()
+
+async def serve_asyncio(server_socket):
+    """Serve all clients from an asyncio event loop"""
+    server = await asyncio.start_unix_server(handle_stream, sock=server_socket)
+    async with server:
+        await server.serve_forever()
+
+def serve_threaded(server_socket):
+    """Serve clients from a bounded pool of threads"""
+    # Each client holds a thread for its whole session, so clients beyond the
+    # pool size are turned away instead of queueing behind idle sessions
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_THREADED_CLIENTS)
+    clients = set()
+    try:
+        while True:
+            conn, addr = server_socket.accept()
+            if len(clients) >= MAX_THREADED_CLIENTS:
+                print(f"Refusing client: {MAX_THREADED_CLIENTS} clients already connected", file=sys.stderr)
+                try:
+                    conn.sendall(SERVER_BUSY_RESPONSE)
+                except OSError:
+                    pass
+                conn.close()
+                continue
+            clients.add(conn)
+            future = pool.submit(handle_client, conn)
+            future.add_done_callback(lambda future, conn=conn: clients.discard(conn))
+    finally:
+        # Pool threads are not daemons, so unblock idle clients to let them exit
+        for conn in list(clients):
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        pool.shutdown()
+
+def serve(server_socket):
+    """Serve clients with the fastest backend available"""
+    # Prefer uvloop's libuv event loop, then our own selector loop when
+    # epoll/kqueue is available, and threads otherwise
+    if uvloop is not None:
+        uvloop.run(serve_asyncio(server_socket))
+    elif hasattr(selectors, "EpollSelector") or hasattr(selectors, "KqueueSelector"):
+        serve_selector(server_socket)
+    else:
+        serve_threaded(server_socket)
+
+def serve_workers(server_socket, workers):
+    """Fork worker processes that all accept on the shared listening socket"""
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                serve(server_socket)
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            # Leave socket cleanup to the parent
+            os._exit(status)
+        pids.append(pid)
+
+    # Turn SIGTERM into a normal exit so the workers get stopped too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
 
 def main():
-    if len(sys.argv) != 2:
-        print("Usage: python3 test_pipe_server.py <socket_path>")
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and not sys.argv[2].isdigit()):
+        print("Usage: python3 test_pipe_server.py <socket_path> [workers]")
         sys.exit(1)
-    
+
     socket_path = sys.argv[1]
-    
+    # 0 workers means one per CPU; fork is needed for more than one
+    workers = int(sys.argv[2]) if len(sys.argv) == 3 else 1
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    if not hasattr(os, "fork"):
+        workers = 1
+
     # Remove socket file if it exists
     if os.path.exists(socket_path):
         os.unlink(socket_path)
-    
+
     # Create Unix domain socket
     server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
     server_socket.bind(socket_path)
-    server_socket.listen(5)
-    
+    server_socket.listen(socket.SOMAXCONN)
+
     print(f"Named pipe MCP server listening on: {socket_path}", file=sys.stderr)
-    
+
     try:
-        while True:
-            conn, addr = server_socket.accept()
-            # Handle each client in a separate thread
-            client_thread = threading.Thread(target=handle_client, args=(conn,))
-            client_thread.daemon = True
-            client_thread.start()
+        if workers > 1:
+            serve_workers(server_socket, workers)
+        else:
+            serve(server_socket)
     except KeyboardInterrupt:
         print("\nShutting down server...", file=sys.stderr)
     finally: